@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Hugo Nistal Gonzalez
+"""
+
+import asyncio
+import random
+import time
+
+
+class ReconnectBackoff:
+    """Exponential backoff with jitter between reconnect attempts."""
+    def __init__(self, base_delay: float, max_delay: float, factor: float = 2.0, jitter: float = 0.2):
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._factor = factor
+        self._jitter = jitter
+        self._attempts = 0
+
+    @property
+    def attempts(self):
+        return self._attempts
+
+    @property
+    def max_delay(self):
+        return self._max_delay
+
+    def next_delay(self) -> float:
+        """Return the delay before the next attempt and increase the backoff.
+
+        Returns
+        -------
+        float
+            Delay in seconds, capped at the maximum delay and randomised by +/- jitter.
+        """
+        # The exponent is bounded so long outages cannot overflow the float long after the delay is capped
+        delay = min(self._max_delay, self._base_delay * self._factor ** min(self._attempts, 64))
+        self._attempts += 1
+        return max(0.0, delay * (1 + random.uniform(-self._jitter, self._jitter)))
+
+    def reset(self):
+        """Reset the backoff after a successful connection."""
+        self._attempts = 0
+
+
+class FIXConnectionManager:
+    """Class to handle the TCP connection lifecycle of a FIX gateway: primary and backup hosts, reconnection
+    with backoff and an optional hot-standby connection to the next host, established ahead of time so a
+    failover only needs to send the Logon."""
+    def __init__(self, hosts: list, backoff: ReconnectBackoff, logger, max_attempts: int = 0,
+                 reconnect_timeout: float = 0, connect_timeout: float = 5.0, hot_standby: bool = False,
+                 standby_check_interval: float = 1.0):
+        self._hosts = hosts
+        self._backoff = backoff
+        self._logger = logger
+        self._max_attempts = max_attempts
+        self._reconnect_timeout = reconnect_timeout
+        self._connect_timeout = connect_timeout
+        self._hot_standby = hot_standby and len(hosts) > 1
+        self._standby_check_interval = standby_check_interval
+        self._active_index = None
+        self._next_index = 0
+        self._awaiting_logon = False
+        self._deadline = None
+        self._standby = None
+        self._standby_task = None
+        self._closed = asyncio.Event()
+
+    @classmethod
+    def from_config(cls, config, logger):
+        """Create a connection manager from a gateway configuration section.
+
+        Parameters
+        ----------
+        config: configparser.SectionProxy
+            Gateway configuration section.
+        logger: logging.Logger
+            Engine logger.
+        """
+        hosts = [(config["SocketHost"], config.getint("SocketPort"))]
+        for backup in config.get("BackupSocketHosts", "").split(","):
+            if backup.strip():
+                host, port = backup.strip().rsplit(":", 1)
+                hosts.append((host, int(port)))
+        backoff = ReconnectBackoff(config.getfloat("ReconnectBackoffBase", fallback=0.05),
+                                   config.getfloat("ReconnectBackoffMax",
+                                                   fallback=config.getfloat("ReconnectInterval", fallback=30.0)),
+                                   jitter=config.getfloat("ReconnectJitter", fallback=0.2))
+        return cls(hosts, backoff, logger,
+                   reconnect_timeout=config.getfloat("ReconnectTimeout", fallback=0),
+                   connect_timeout=config.getfloat("ConnectTimeout", fallback=5.0),
+                   hot_standby=config.get("HotStandby", "N") == "Y",
+                   standby_check_interval=config.getfloat("StandbyCheckInterval", fallback=1.0))
+
+    @property
+    def active_host(self):
+        if self._active_index is None:
+            return None
+        return self._hosts[self._active_index]
+
+    async def connect(self):
+        """Open a connection to the gateway. A ready standby connection is promoted straight away, otherwise the
+        hosts are tried in order, starting after the last active host, waiting the backoff delay between attempts.
+        If the previous connection never logged on, the backoff delay is also applied before the first attempt.
+        The reconnect_timeout runs from the first connect after the last successful Logon, so connections that
+        never log on count against it. A max_attempts or reconnect_timeout of 0 means retrying forever.
+
+        Returns
+        -------
+        asyncio.StreamReader
+            Stream reader of the new connection.
+        asyncio.StreamWriter
+            Stream writer of the new connection.
+
+        Raises
+        ------
+        ConnectionError
+            If max_attempts consecutive attempts failed, reconnect_timeout elapsed without a connection or the
+            connection manager was closed.
+        """
+        if self._closed.is_set():
+            raise ConnectionError("Connection manager closed")
+        if self._reconnect_timeout > 0 and self._deadline is None:
+            self._deadline = time.monotonic() + self._reconnect_timeout
+
+        attempt = 0
+        while self._max_attempts <= 0 or attempt < self._max_attempts:
+            if attempt or self._awaiting_logon:
+                delay = self._backoff.next_delay()
+                if self._deadline is not None:
+                    if time.monotonic() >= self._deadline:
+                        raise ConnectionError(f"Reconnect timeout ({self._reconnect_timeout}s) elapsed")
+                    delay = min(delay, self._deadline - time.monotonic())
+                if await self._wait_closed(delay):
+                    break
+            if not attempt:
+                connection = self._promote_standby()
+                if connection is not None:
+                    return connection
+            index = (self._next_index + attempt) % len(self._hosts)
+            host, port = self._hosts[index]
+            attempt += 1
+            try:
+                reader, writer = await self._open_connection(host, port)
+            except (OSError, asyncio.TimeoutError):
+                self._logger.warning(f"Connection attempt {attempt} to {host}:{port} failed", exc_info=True)
+                continue
+            if self._closed.is_set():
+                writer.close()
+                break
+            self._set_active(index)
+            return reader, writer
+        if self._closed.is_set():
+            raise ConnectionError("Connection manager closed")
+        raise ConnectionError(f"Unable to connect after {attempt} attempts")
+
+    def reset_backoff(self):
+        """Reset the backoff and the reconnect deadline once the session has logged on."""
+        self._backoff.reset()
+        self._awaiting_logon = False
+        self._deadline = None
+
+    async def close(self):
+        """Stop connecting, stop warming the standby connection and close it."""
+        self._closed.set()
+        self._cancel_standby_task()
+        if self._standby is not None:
+            self._standby[2].close()
+            self._standby = None
+
+    async def _wait_closed(self, delay) -> bool:
+        """Wait for the given delay, returning early with True if the connection manager is closed."""
+        try:
+            await asyncio.wait_for(self._closed.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        return self._closed.is_set()
+
+    async def _open_connection(self, host, port):
+        return await asyncio.wait_for(asyncio.open_connection(host, port), self._connect_timeout)
+
+    def _set_active(self, index):
+        self._active_index = index
+        self._next_index = (index + 1) % len(self._hosts)
+        self._awaiting_logon = True
+        if self._hot_standby and not self._closed.is_set():
+            self._standby_task = asyncio.ensure_future(self._standby_loop(self._next_index))
+
+    def _promote_standby(self):
+        """Return the standby connection if it is still open, making its host the active one."""
+        self._cancel_standby_task()
+        if self._standby is None:
+            return None
+        index, reader, writer = self._standby
+        self._standby = None
+        if reader.at_eof() or writer.is_closing():
+            writer.close()
+            return None
+        host, port = self._hosts[index]
+        self._logger.info(f"Promoting standby connection to {host}:{port}")
+        self._set_active(index)
+        return reader, writer
+
+    def _cancel_standby_task(self):
+        if self._standby_task is not None:
+            self._standby_task.cancel()
+            self._standby_task = None
+
+    async def _standby_loop(self, index):
+        """Keep an established connection to the given host, re-opening it if the gateway closes it."""
+        host, port = self._hosts[index]
+        backoff = ReconnectBackoff(self._standby_check_interval, self._backoff.max_delay)
+        while True:
+            if self._standby is not None and (self._standby[1].at_eof() or self._standby[2].is_closing()):
+                self._logger.warning(f"Standby connection to {host}:{port} closed")
+                self._standby[2].close()
+                self._standby = None
+            if self._standby is None:
+                try:
+                    reader, writer = await self._open_connection(host, port)
+                except (OSError, asyncio.TimeoutError):
+                    self._logger.warning(f"Standby connection to {host}:{port} failed")
+                    await asyncio.sleep(backoff.next_delay())
+                    continue
+                self._standby = (index, reader, writer)
+                backoff.reset()
+                self._logger.info(f"Standby connection ready to {host}:{port}")
+            await asyncio.sleep(self._standby_check_interval)
@@ -12,12 +12,30 @@ from session_handler import FIXSessionHandler
 from aiolimiter import AsyncLimiter
 from socket_connection_state import SocketConnectionState
 from fix_client_messages import FixBusinessMessages
+from connection_manager import FIXConnectionManager
 import configparser
 from uuid import uuid4
 
 
 class FIXConnectionHandler(object):
-    def __init__(self, config_file, gateway, listener, loop):
+    """Class to handle a FIX session over a TCP connection to a gateway, reconnecting and failing over to the
+    backup hosts when the connection is lost.
+
+    Parameters
+    ----------
+    config_file: str
+        Path to the configuration file.
+    gateway: str
+        Gateway section of the configuration file.
+    listener: coroutine function
+        Called with every business FIX Message received.
+    loop: asyncio.AbstractEventLoop
+        Event loop running the session.
+    cancel_on_disconnect: coroutine function, optional
+        Called without arguments when a logged in session is lost unexpectedly. It runs concurrently with the
+        reconnection, so it must not send messages on this handler before awaiting wait_logged_in().
+    """
+    def __init__(self, config_file, gateway, listener, loop, cancel_on_disconnect=None):
         self._config = self._load_config(config_file, gateway)
         self._connection_state = SocketConnectionState.DISCONNECTED
         self._reader = None
@@ -28,20 +46,25 @@ class FIXConnectionHandler(object):
                                                    self._config['SenderPassword'], self._config['BeginString'],
                                                    self._config.getint('HeartBeatInterval'))
         self._listener = listener
+        self._cancel_on_disconnect = cancel_on_disconnect
+        self._cancel_on_disconnect_tasks = set()
+        self._shutdown = False
+        self._session_logged_in = False
+        self._logged_in = asyncio.Event()
         self._last_rcv_msg = time.time()
         self._last_sent_msg = time.time()
         self._missed_heartbeats = 0
-        self._last_logon_attempt = 0
-        self._logon_count = 0
         self._buffer_size = 150
         self._rate_limiter = AsyncLimiter(self._config.getint("MaxMessagesNo"),
                                           self._config.getint("MaxMessagesPeriodInSec"))
         self._heartbeat_interval = self._config.getint("HeartBeatInterval")
+        self._logon_timeout = self._config.getfloat("LogonTimeout", fallback=10.0)
         self._fix_logger = self._setup_logger(name=self._config["BeginString"],
                                               filename=f"{self._config['SenderCompID']}-fixMessages")
         self._engine_logger = self._setup_logger(name=self._config["SenderCompID"],
                                                  filename=f"{self._config['SenderCompID']}-session",
                                                  formatter="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        self._connection_manager = FIXConnectionManager.from_config(self._config, self._engine_logger)
         asyncio.ensure_future(self._engine_read_loop(), loop=loop)
         asyncio.ensure_future(self._heartbeat_loop(), loop=loop)
 
@@ -49,29 +72,92 @@ class FIXConnectionHandler(object):
     def connection_state(self):
         return self._connection_state
 
-    async def _engine_read_loop(self):
-        self._reader, self._writer = await asyncio.open_connection(self._config["SocketHost"],
-                                                                   self._config["SocketPort"])
-        self._connection_state = SocketConnectionState.CONNECTED
-        self._engine_logger.info(f"Socket Connection Open to {self._config['SocketHost']}:{self._config['SocketPort']}")
+    async def wait_logged_in(self):
+        """Wait until the session is logged in."""
+        await self._logged_in.wait()
 
-        await self._logon()
+    async def _engine_read_loop(self):
+        while not self._shutdown:
+            if not await self._open_connection():
+                break
 
-        while self._connectionState != SocketConnectionState.DISCONNECTED:
-            if self._connectionState != SocketConnectionState.LOGGED_OUT:
-                await self._read_message()
-            else:
+            try:
                 await self._logon()
+                logon_deadline = time.time() + self._logon_timeout
+                while self._connection_state in (SocketConnectionState.CONNECTED, SocketConnectionState.LOGGED_IN):
+                    if self._connection_state == SocketConnectionState.CONNECTED:
+                        await asyncio.wait_for(self._read_message(), max(0.0, logon_deadline - time.time()))
+                    else:
+                        await self._read_message()
+            except asyncio.TimeoutError:
+                self._engine_logger.error(f"Logon response not received after {self._logon_timeout} seconds")
+            except OSError:
+                pass
+            except Exception:
+                self._engine_logger.error("Unexpected error in session. Treating it as connection lost", exc_info=True)
+
+            if not self._shutdown:
+                await self._handle_connection_lost()
 
     async def _heartbeat_loop(self):
-        while self._connectionState != SocketConnectionState.DISCONNECTED:
-            if self._connectionState != SocketConnectionState.LOGGED_OUT:
+        while not self._shutdown:
+            if self._connection_state == SocketConnectionState.LOGGED_IN:
                 await self._send_heartbeat()
                 await self._is_expected_heartbeat()
+            await asyncio.sleep(1)
+
+    async def _open_connection(self) -> bool:
+        """Open the socket connection through the connection manager and reset the session state for a new Logon.
+
+        Returns
+        -------
+        bool
+            True if the connection was opened else False, once ReconnectTimeout elapses or on disconnect.
+        """
+        try:
+            reader, writer = await self._connection_manager.connect()
+        except Exception:
+            if not self._shutdown:
+                self._engine_logger.error("Unable to open socket connection. Disconnecting", exc_info=True)
+            self._shutdown = True
+            self._connection_state = SocketConnectionState.DISCONNECTED
+            return False
+        if self._shutdown:
+            writer.close()
+            return False
+        self._reader, self._writer = reader, writer
+        self._connection_state = SocketConnectionState.CONNECTED
+        host, port = self._connection_manager.active_host
+        self._engine_logger.info(f"Socket Connection Open to {host}:{port}")
+        # Logon is always sent with ResetSeqNumFlag=Y
+        self._fix_parser = simplefix.FixParser()
+        self._session.reset_seq_no()
+        self._last_rcv_msg = time.time()
+        self._missed_heartbeats = 0
+        self._session_logged_in = False
+        return True
+
+    async def _handle_connection_lost(self):
+        """Handle unexpected loss of the session. Close the socket and notify the cancel on disconnect hook
+        without holding back the reconnection. The hook is only notified if the session had logged in."""
+        self._engine_logger.warning(f"{self._config['SenderCompID']} session lost. Reconnecting")
+        await self._handle_close()
+        if self._cancel_on_disconnect is not None and self._session_logged_in:
+            task = asyncio.ensure_future(self._notify_cancel_on_disconnect())
+            self._cancel_on_disconnect_tasks.add(task)
+            task.add_done_callback(self._cancel_on_disconnect_tasks.discard)
+        self._session_logged_in = False
+
+    async def _notify_cancel_on_disconnect(self):
+        """Call the registered cancel on disconnect hook."""
+        try:
+            await self._cancel_on_disconnect()
+        except Exception:
+            self._engine_logger.error("Error in cancel on disconnect hook", exc_info=True)
 
     @staticmethod
     def _load_config(file_path, gateway):
-        parser = configparser.SafeConfigParser()
+        parser = configparser.ConfigParser()
         parser.read(file_path)
         if parser.has_section(gateway):
             return parser[gateway]
@@ -88,15 +174,19 @@ class FIXConnectionHandler(object):
 
     async def disconnect(self):
         """Disconnect Session."""
-        if self._connection_state != SocketConnectionState.LOGGED_OUT:
+        self._shutdown = True
+        if self._connection_state in (SocketConnectionState.CONNECTED, SocketConnectionState.LOGGED_IN):
             await self._logout()
         await self._handle_close()
+        await self._connection_manager.close()
 
     async def _handle_close(self):
         """Handle Close Writer Socket Connection."""
-        if self._connection_state == SocketConnectionState.DISCONNECTED:
-            self._engine_logger.info(f"{self._config['SenderCompID']} session -> DISCONNECTED")
+        self._logged_in.clear()
+        if self._writer is not None and not self._writer.is_closing():
             self._writer.close()
+        if self._connection_state != SocketConnectionState.DISCONNECTED:
+            self._engine_logger.info(f"{self._config['SenderCompID']} session -> DISCONNECTED")
             self._connection_state = SocketConnectionState.DISCONNECTED
 
     async def send_message(self, message: simplefix.FixMessage):
@@ -114,8 +204,13 @@ class FIXConnectionHandler(object):
         self._session.sequence_num_handler(message)
         message = message.encode()
         async with self._rate_limiter:
-            self._writer.write(message)
-            await self._writer.drain()
+            try:
+                self._writer.write(message)
+                await self._writer.drain()
+            except OSError:
+                self._engine_logger.error("Connection Closed Unexpected while sending message.", exc_info=True)
+                await self._handle_close()
+                return
             self._last_sent_msg = time.time()
         self._fix_logger.info(f"{FIXConnectionHandler.print_fix(message)}")
 
@@ -124,8 +219,8 @@ class FIXConnectionHandler(object):
 
         Raises
         ------
-        ConnectionError
-            If the TCP socket is closed but the application is trying to read a message from it.
+        OSError
+            If the TCP socket is closed or fails while the application is trying to read a message from it.
         CancelledError
             If a timeout occurs while reading a message from the TCP socket.
         """
@@ -134,17 +229,16 @@ class FIXConnectionHandler(object):
             while message is None:
                 buffer = await self._reader.read(self._buffer_size)
                 if not buffer:
-                    break
+                    raise ConnectionError("Socket closed by peer")
 
                 self._fix_parser.append_buffer(buffer)
                 message = self._fix_parser.get_message()
 
-            if message is None:
-                return
             self._fix_logger.info(f"{message}")
             await self._process_message(message)
-        except ConnectionError as e:
-            self._engine_logger.error("Connection Closed Unexpected.", exc_info=True)
+        except OSError as e:
+            if not self._shutdown:
+                self._engine_logger.error("Connection Closed Unexpected.", exc_info=True)
             raise e
         except asyncio.CancelledError as e:
             self._engine_logger.error(f"{self._config['SenderCompID']} Read Message Timed Out", exc_info=True)
@@ -198,27 +292,20 @@ class FIXConnectionHandler(object):
 
     async def _logon(self):
         """Handle Logon."""
-        if self._logon_count >= self._config.getint('MaxReconnectAttempts'):
-            self._engine_logger.error(f"Max Logon attempts ({self._config.getint('MaxReconnectAttempts')}) reached."
-                                      f" Disconnecting")
-            await self.disconnect()
         self._engine_logger.info(f"{self._config['SenderCompID']} session -> Sending LOGON")
-        if time.time() - self._last_logon_attempt > self._config.getint('ReconnectInterval'):
-            msg = self._client_message.send_log_on()
-            await self.send_message(msg)
-            self._last_logon_attempt = time.time()
+        await self.send_message(self._client_message.send_log_on())
 
     async def _logout(self):
         """Handle Logout."""
         self._engine_logger.info(f"{self._config['SenderCompID']} session -> Sending LOGOUT")
-        self._connection_state = SocketConnectionState.LOGGED_OUT
         await self.send_message(self._client_message.send_log_out())
+        self._connection_state = SocketConnectionState.LOGGED_OUT
 
     async def _is_expected_heartbeat(self):
         """Check if a heartbeat should have been received. If it should have been received, but it hasn't,
         then send a Test Request message to verify if the connection is healthy.
         If the configured MaxMissedHeartBeats is reached, then close the connection."""
-        if time.time() - self._last_rcv_msg > self._heartbeat_interval:
+        if time.time() - self._last_rcv_msg > self._heartbeat_interval * (self._missed_heartbeats + 1):
             self._engine_logger.warning(f"Heartbeat expected not received. "
                                         f"Missed Heartbeats: {self._missed_heartbeats}")
             self._missed_heartbeats += 1
@@ -227,6 +314,7 @@ class FIXConnectionHandler(object):
             self._engine_logger.error(f"Max Missed Heartbeats ({self._config.getint('MaxMissedHeartBeats')}) reached."
                                       f" Loging out")
             await self._logout()
+            await self._handle_close()
 
     async def _send_heartbeat(self):
         if time.time() - self._last_sent_msg > self._heartbeat_interval:
@@ -249,7 +337,7 @@ class FIXConnectionHandler(object):
 
         msg_type = message.get(simplefix.TAG_MSGTYPE)
         if msg_type == simplefix.MSGTYPE_LOGON:  # Handle logon
-            if self._connectionState == SocketConnectionState.LOGGED_IN:
+            if self._connection_state == SocketConnectionState.LOGGED_IN:
                 if message.get(simplefix.TAG_RESETSEQNUMFLAG) == simplefix.RESETSEQNUMFLAG_YES:
                     self._session.reset_seq_no()
                     self._engine_logger.info("Resetting Sequence Number to 1")
@@ -258,18 +346,21 @@ class FIXConnectionHandler(object):
                 return True
 
             else:
-                self._connectionState = SocketConnectionState.LOGGED_IN
+                self._connection_state = SocketConnectionState.LOGGED_IN
+                self._session_logged_in = True
+                self._logged_in.set()
+                self._connection_manager.reset_backoff()
                 self._engine_logger.info(f"{self._config['SenderCompID']} session -> LOGON")
-                self._heartbeat_interval = str(message.get(simplefix.TAG_HEARTBTINT).decode())
+                self._heartbeat_interval = int(message.get(simplefix.TAG_HEARTBTINT).decode())
                 return True
-        elif self._connectionState == SocketConnectionState.LOGGED_IN:
+        elif self._connection_state == SocketConnectionState.LOGGED_IN:
             if msg_type == simplefix.MSGTYPE_TEST_REQUEST:
                 msg = self._client_message.send_heartbeat()
                 msg.append_pair(simplefix.TAG_TESTREQID, message.get(simplefix.TAG_TESTREQID))
                 await self.send_message(msg)
                 return True
             elif msg_type == simplefix.MSGTYPE_LOGOUT:  # Handle Logout
-                self._connectionState = SocketConnectionState.LOGGED_OUT
+                self._connection_state = SocketConnectionState.LOGGED_OUT
                 self._engine_logger.info(f"{self._config['SenderCompID']} session -> LOGOUT")
                 await self._handle_close()
                 return True
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import configparser
+import logging
+
+import pytest
+
+from connection_manager import FIXConnectionManager, ReconnectBackoff
+
+logger = logging.getLogger("test_connection_manager")
+
+
+class Gateway:
+    """Local TCP endpoint recording the connections it accepts."""
+    def __init__(self):
+        self.connections = []
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    @property
+    def address(self):
+        return "127.0.0.1", self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        for writer in self.connections:
+            writer.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections.append(writer)
+
+
+async def dead_address():
+    gateway = await Gateway().start()
+    address = gateway.address
+    await gateway.stop()
+    return address
+
+
+def make_manager(hosts, **kwargs):
+    return FIXConnectionManager(hosts, ReconnectBackoff(0.01, 0.05, jitter=0), logger, **kwargs)
+
+
+def test_backoff_delays_double_up_to_max():
+    backoff = ReconnectBackoff(0.1, 0.5, jitter=0)
+    assert [backoff.next_delay() for _ in range(5)] == pytest.approx([0.1, 0.2, 0.4, 0.5, 0.5])
+    assert backoff.attempts == 5
+
+
+def test_backoff_does_not_overflow_on_long_outage():
+    backoff = ReconnectBackoff(0.1, 5, jitter=0)
+    for _ in range(5000):
+        delay = backoff.next_delay()
+    assert delay == pytest.approx(5)
+
+
+def test_backoff_reset():
+    backoff = ReconnectBackoff(0.1, 10, jitter=0)
+    backoff.next_delay()
+    backoff.next_delay()
+    backoff.reset()
+    assert backoff.attempts == 0
+    assert backoff.next_delay() == pytest.approx(0.1)
+
+
+def test_backoff_jitter_within_bounds():
+    backoff = ReconnectBackoff(1, 1, jitter=0.2)
+    for _ in range(100):
+        assert 0.8 <= backoff.next_delay() <= 1.2
+
+
+def test_from_config_parses_backup_hosts():
+    parser = configparser.ConfigParser()
+    parser.read_string("""
+        [FIX-OM]
+        SocketHost=primary
+        SocketPort=1
+        BackupSocketHosts=backup1:2, backup2:3
+        HotStandby=Y
+        ReconnectTimeout=60
+    """)
+    manager = FIXConnectionManager.from_config(parser["FIX-OM"], logger)
+    assert manager._hosts == [("primary", 1), ("backup1", 2), ("backup2", 3)]
+    assert manager._hot_standby
+    assert manager._reconnect_timeout == 60
+
+
+def test_from_config_without_backup_hosts():
+    parser = configparser.ConfigParser()
+    parser.read_string("""
+        [FIX-MD]
+        SocketHost=primary
+        SocketPort=1
+        HotStandby=Y
+    """)
+    manager = FIXConnectionManager.from_config(parser["FIX-MD"], logger)
+    assert manager._hosts == [("primary", 1)]
+    assert not manager._hot_standby
+    assert manager._reconnect_timeout == 0
+
+
+def test_connect_rotates_to_next_host():
+    async def run():
+        primary, backup = await Gateway().start(), await Gateway().start()
+        manager = make_manager([primary.address, backup.address])
+
+        await manager.connect()
+        assert manager.active_host == primary.address
+
+        await manager.connect()
+        assert manager.active_host == backup.address
+
+        await primary.stop()
+        await backup.stop()
+
+    asyncio.run(run())
+
+
+def test_connect_skips_dead_host():
+    async def run():
+        backup = await Gateway().start()
+        manager = make_manager([await dead_address(), backup.address])
+
+        await manager.connect()
+        assert manager.active_host == backup.address
+        await backup.stop()
+
+    asyncio.run(run())
+
+
+def test_connect_all_hosts_down_max_attempts():
+    async def run():
+        manager = make_manager([await dead_address(), await dead_address()], max_attempts=4)
+        with pytest.raises(ConnectionError):
+            await manager.connect()
+        assert manager.active_host is None
+
+    asyncio.run(run())
+
+
+def test_connect_all_hosts_down_reconnect_timeout():
+    async def run():
+        manager = make_manager([await dead_address(), await dead_address()], reconnect_timeout=0.2)
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(manager.connect(), 2)
+
+    asyncio.run(run())
+
+
+def test_connect_promotes_standby():
+    async def run():
+        primary, backup = await Gateway().start(), await Gateway().start()
+        manager = make_manager([primary.address, backup.address], hot_standby=True, standby_check_interval=0.01)
+
+        await manager.connect()
+        await asyncio.sleep(0.1)
+        assert len(backup.connections) == 1
+
+        await manager.connect()
+        assert manager.active_host == backup.address
+        assert len(backup.connections) == 1
+
+        await manager.close()
+        await primary.stop()
+        await backup.stop()
+
+    asyncio.run(run())
+
+
+def test_connect_skips_closed_standby():
+    async def run():
+        primary, backup = await Gateway().start(), await Gateway().start()
+        manager = make_manager([primary.address, backup.address], hot_standby=True, standby_check_interval=60)
+
+        await manager.connect()
+        await asyncio.sleep(0.1)
+        assert len(backup.connections) == 1
+        backup.connections[0].close()
+        await asyncio.sleep(0.1)
+
+        await manager.connect()
+        assert manager.active_host == backup.address
+        assert len(backup.connections) == 2
+
+        await manager.close()
+        await primary.stop()
+        await backup.stop()
+
+    asyncio.run(run())
+
+
+def test_close_stops_connect_in_progress():
+    async def run():
+        manager = FIXConnectionManager([await dead_address()], ReconnectBackoff(10, 10, jitter=0), logger)
+        connect = asyncio.ensure_future(manager.connect())
+        await asyncio.sleep(0.05)
+        await manager.close()
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(connect, 1)
+
+    asyncio.run(run())
+
+
+def test_no_standby_after_close():
+    async def run():
+        primary, backup = await Gateway().start(), await Gateway().start()
+        manager = make_manager([primary.address, backup.address], hot_standby=True, standby_check_interval=0.01)
+        await manager.close()
+        with pytest.raises(ConnectionError):
+            await manager.connect()
+        await asyncio.sleep(0.1)
+        assert primary.connections == []
+        assert backup.connections == []
+        await primary.stop()
+        await backup.stop()
+
+    asyncio.run(run())
+
+
+def test_backoff_not_reset_until_logon():
+    async def run():
+        gateway = await Gateway().start()
+        manager = make_manager([gateway.address])
+
+        await manager.connect()
+        await manager.connect()
+        await manager.connect()
+        assert manager._backoff.attempts == 2
+
+        manager.reset_backoff()
+        assert manager._backoff.attempts == 0
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_reconnect_timeout_spans_connections_without_logon():
+    async def run():
+        gateway = await Gateway().start()
+        manager = make_manager([gateway.address], reconnect_timeout=0.2)
+        with pytest.raises(ConnectionError):
+            while True:
+                await asyncio.wait_for(manager.connect(), 2)
+        await gateway.stop()
+
+    asyncio.run(run())
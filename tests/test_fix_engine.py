@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+import simplefix
+
+from fix_engine import FIXConnectionHandler
+from socket_connection_state import SocketConnectionState
+
+CONFIG = """[FIX-OM]
+BeginString=FIX.4.4
+TargetCompID=P
+HeartBeatInterval=30
+MaxMissedHeartBeats=3
+ResetSequenceOnLogon=Y
+SenderCompID=X
+SenderPassword=Z
+SocketHost={host}
+SocketPort={port}
+BackupSocketHosts={backups}
+HotStandby={hot_standby}
+ReconnectInterval=60
+ReconnectBackoffBase=0.01
+ReconnectBackoffMax=0.05
+ReconnectJitter=0
+ReconnectTimeout={reconnect_timeout}
+LogonTimeout={logon_timeout}
+ConnectTimeout=1
+FileLogPath={log_path}
+MaxMessagesNo=100
+MaxMessagesPeriodInSec=1
+"""
+
+
+class FIXGateway:
+    """Local FIX acceptor. on_logon is "accept" to answer the Logon, "silent" to ignore it or "close" to close
+    the connection."""
+    def __init__(self, on_logon="accept"):
+        self.on_logon = on_logon
+        self.connections = []
+        self.messages = []
+        self._seq_no = 0
+        self._server = None
+
+    async def start(self, port=0):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", port)
+        return self
+
+    @property
+    def address(self):
+        return "127.0.0.1", self._server.sockets[0].getsockname()[1]
+
+    def msg_types(self):
+        return [message.get(simplefix.TAG_MSGTYPE) for message in self.messages]
+
+    async def send(self, msg_type, *pairs):
+        self._seq_no += 1
+        msg = simplefix.FixMessage()
+        for tag, value in [(8, "FIX.4.4"), (35, msg_type), (49, "P"), (56, "X"), (34, self._seq_no), *pairs]:
+            msg.append_pair(tag, value)
+        self.connections[-1].write(msg.encode())
+        await self.connections[-1].drain()
+
+    def drop(self):
+        for writer in self.connections:
+            writer.close()
+
+    async def stop(self):
+        self._server.close()
+        self.drop()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections.append(writer)
+        parser = simplefix.FixParser()
+        try:
+            while True:
+                buffer = await reader.read(4096)
+                if not buffer:
+                    return
+                parser.append_buffer(buffer)
+                message = parser.get_message()
+                while message is not None:
+                    self.messages.append(message)
+                    if message.get(simplefix.TAG_MSGTYPE) == simplefix.MSGTYPE_LOGON:
+                        if self.on_logon == "accept":
+                            self._seq_no = 0
+                            await self.send(simplefix.MSGTYPE_LOGON, (108, 30))
+                        elif self.on_logon == "close":
+                            writer.close()
+                            return
+                    message = parser.get_message()
+        except (ConnectionError, asyncio.CancelledError):
+            return
+
+
+async def dead_address():
+    gateway = await FIXGateway().start()
+    address = gateway.address
+    await gateway.stop()
+    return address
+
+
+async def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not met before timeout"
+        await asyncio.sleep(0.01)
+
+
+def make_engine(tmp_path, hosts, listener=None, cancel_on_disconnect=None, hot_standby="N", reconnect_timeout=0,
+                logon_timeout=1):
+    (host, port), backups = hosts[0], hosts[1:]
+    config_file = tmp_path / "config.cfg"
+    config_file.write_text(CONFIG.format(host=host, port=port, backups=",".join(f"{h}:{p}" for h, p in backups),
+                                         hot_standby=hot_standby, reconnect_timeout=reconnect_timeout,
+                                         logon_timeout=logon_timeout, log_path=tmp_path))
+
+    async def ignore(message):
+        pass
+
+    return FIXConnectionHandler(str(config_file), "FIX-OM", listener or ignore, asyncio.get_running_loop(),
+                                cancel_on_disconnect=cancel_on_disconnect)
+
+
+def logged_in(engine):
+    return lambda: engine.connection_state == SocketConnectionState.LOGGED_IN
+
+
+def test_logon(tmp_path):
+    async def run():
+        gateway = await FIXGateway().start()
+        engine = make_engine(tmp_path, [gateway.address])
+        await wait_until(logged_in(engine))
+        assert gateway.msg_types() == [simplefix.MSGTYPE_LOGON]
+        await engine.disconnect()
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_reconnect_after_drop(tmp_path):
+    async def run():
+        gateway = await FIXGateway().start()
+        engine = make_engine(tmp_path, [gateway.address])
+        await wait_until(logged_in(engine))
+
+        gateway.drop()
+        await wait_until(lambda: gateway.msg_types().count(simplefix.MSGTYPE_LOGON) == 2)
+        await wait_until(logged_in(engine))
+        assert len(gateway.connections) == 2
+        await engine.disconnect()
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_failover_to_promoted_standby(tmp_path):
+    async def run():
+        primary, backup = await FIXGateway().start(), await FIXGateway().start()
+        engine = make_engine(tmp_path, [primary.address, backup.address], hot_standby="Y")
+        await wait_until(logged_in(engine))
+        await wait_until(lambda: len(backup.connections) == 1)
+
+        await primary.stop()
+        await wait_until(lambda: backup.msg_types() == [simplefix.MSGTYPE_LOGON])
+        await wait_until(logged_in(engine))
+        assert len(backup.connections) == 1
+        await engine.disconnect()
+        await backup.stop()
+
+    asyncio.run(run())
+
+
+def test_logon_timeout_fails_over_to_next_host(tmp_path):
+    async def run():
+        primary, backup = await FIXGateway(on_logon="silent").start(), await FIXGateway().start()
+        engine = make_engine(tmp_path, [primary.address, backup.address], logon_timeout=0.1)
+        await wait_until(logged_in(engine))
+        assert primary.msg_types() == [simplefix.MSGTYPE_LOGON]
+        assert engine._connection_manager.active_host == backup.address
+        await engine.disconnect()
+        await primary.stop()
+        await backup.stop()
+
+    asyncio.run(run())
+
+
+def test_one_missed_heartbeat_per_interval(tmp_path):
+    async def run():
+        gateway = await FIXGateway().start()
+        engine = make_engine(tmp_path, [gateway.address])
+        await wait_until(logged_in(engine))
+
+        engine._last_rcv_msg = time.time() - 31
+        await engine._is_expected_heartbeat()
+        await engine._is_expected_heartbeat()
+        assert engine._missed_heartbeats == 1
+
+        engine._last_rcv_msg = time.time() - 61
+        await engine._is_expected_heartbeat()
+        assert engine._missed_heartbeats == 2
+        await wait_until(lambda: gateway.msg_types().count(simplefix.MSGTYPE_TEST_REQUEST) == 2)
+        assert engine.connection_state == SocketConnectionState.LOGGED_IN
+        await engine.disconnect()
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_disconnect_sends_logout(tmp_path):
+    async def run():
+        gateway = await FIXGateway().start()
+        engine = make_engine(tmp_path, [gateway.address])
+        await wait_until(logged_in(engine))
+
+        await engine.disconnect()
+        await wait_until(lambda: simplefix.MSGTYPE_LOGOUT in gateway.msg_types())
+        assert engine.connection_state == SocketConnectionState.DISCONNECTED
+        await asyncio.sleep(0.1)
+        assert len(gateway.connections) == 1
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_send_failure_reconnects(tmp_path):
+    async def run():
+        gateway = await FIXGateway().start()
+        engine = make_engine(tmp_path, [gateway.address])
+        await wait_until(logged_in(engine))
+
+        async def timed_out():
+            raise TimeoutError("ETIMEDOUT")
+
+        engine._writer.drain = timed_out
+        await engine.send_message(engine._client_message.send_heartbeat())
+        assert engine.connection_state != SocketConnectionState.LOGGED_IN
+        await wait_until(lambda: len(gateway.connections) == 2)
+        await wait_until(logged_in(engine))
+        await engine.disconnect()
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_cancel_on_disconnect_after_logged_in_session(tmp_path):
+    async def run():
+        calls = []
+
+        async def cancel_on_disconnect():
+            calls.append(time.time())
+
+        gateway = await FIXGateway().start()
+        engine = make_engine(tmp_path, [gateway.address], cancel_on_disconnect=cancel_on_disconnect)
+        await wait_until(logged_in(engine))
+        assert calls == []
+
+        gateway.drop()
+        await wait_until(lambda: len(calls) == 1)
+        await wait_until(logged_in(engine))
+        await engine.disconnect()
+        await asyncio.sleep(0.05)
+        assert len(calls) == 1
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_cancel_on_disconnect_not_called_before_logon(tmp_path):
+    async def run():
+        calls = []
+
+        async def cancel_on_disconnect():
+            calls.append(time.time())
+
+        gateway = await FIXGateway(on_logon="close").start()
+        engine = make_engine(tmp_path, [gateway.address], cancel_on_disconnect=cancel_on_disconnect)
+        await wait_until(lambda: len(gateway.connections) >= 2)
+        assert calls == []
+        await engine.disconnect()
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_disconnect_stops_reconnect(tmp_path):
+    async def run():
+        host, port = await dead_address()
+        engine = make_engine(tmp_path, [(host, port)])
+        await asyncio.sleep(0.1)
+        await engine.disconnect()
+
+        gateway = await FIXGateway().start(port)
+        await asyncio.sleep(0.3)
+        assert gateway.connections == []
+        assert engine.connection_state == SocketConnectionState.DISCONNECTED
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_backoff_when_gateway_closes_before_logon(tmp_path):
+    async def run():
+        gateway = await FIXGateway(on_logon="close").start()
+        engine = make_engine(tmp_path, [gateway.address])
+        await asyncio.sleep(0.5)
+        assert not engine._shutdown
+        assert 2 < len(gateway.connections) < 30
+        await engine.disconnect()
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_reconnect_timeout_without_logon(tmp_path):
+    async def run():
+        gateway = await FIXGateway(on_logon="close").start()
+        engine = make_engine(tmp_path, [gateway.address], reconnect_timeout=0.3)
+        await wait_until(lambda: engine._shutdown)
+        assert engine.connection_state == SocketConnectionState.DISCONNECTED
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_listener_error_reconnects(tmp_path):
+    async def run():
+        async def listener(message):
+            raise ValueError("listener failure")
+
+        gateway = await FIXGateway().start()
+        engine = make_engine(tmp_path, [gateway.address], listener=listener)
+        await wait_until(logged_in(engine))
+
+        await gateway.send(simplefix.MSGTYPE_EXECUTION_REPORT, (simplefix.TAG_CLORDID, "1"))
+        await wait_until(lambda: gateway.msg_types().count(simplefix.MSGTYPE_LOGON) == 2)
+        await wait_until(logged_in(engine))
+        await engine.disconnect()
+        await gateway.stop()
+
+    asyncio.run(run())
+
+
+def test_cancel_on_disconnect_waits_for_logon(tmp_path):
+    async def run():
+        states = []
+
+        async def cancel_on_disconnect():
+            await engine.wait_logged_in()
+            states.append(engine.connection_state)
+            await engine.send_message(engine._client_message.create_message(simplefix.MSGTYPE_ORDER_CANCEL_REQUEST))
+
+        gateway = await FIXGateway().start()
+        engine = make_engine(tmp_path, [gateway.address], cancel_on_disconnect=cancel_on_disconnect)
+        await wait_until(logged_in(engine))
+
+        gateway.drop()
+        await wait_until(lambda: simplefix.MSGTYPE_ORDER_CANCEL_REQUEST in gateway.msg_types())
+        assert states == [SocketConnectionState.LOGGED_IN]
+        assert gateway.msg_types()[-2:] == [simplefix.MSGTYPE_LOGON, simplefix.MSGTYPE_ORDER_CANCEL_REQUEST]
+        await engine.disconnect()
+        await gateway.stop()
+
+    asyncio.run(run())